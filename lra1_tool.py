@@ -23,6 +23,7 @@ import argparse
 import os
 import sys
 import time
+import struct
 import serial    # Requires pySerial: pip install pyserial
 import binascii
 
@@ -44,6 +45,13 @@ BSL_CMD_RX_DATA_BLOCK_VERIFY   = 0x12
 BSL_CMD_LOAD_PC                = 0x17
 BSL_CMD_RX_DATA_BLOCK_FAST     = 0x1b
 
+# DFUモード移行・リセット用の送受信データ
+DFU_PROBE       = b"\xaa"              # DFUモード確認用の送信バイト
+DFU_PROBE_ACK   = 0x55                 # DFUモード確認に対する応答
+DFU_KEY         = b"i2LoRa"            # DFUモード移行キー
+DFU_KEY_ACK     = 0xaa                 # 移行キーに対する応答
+RESET_COMMAND   = b"\x03RESET\r\n"     # ソフトウェアリセットコマンド
+
 # ファイル内に含まれるべきマジックバイト ("i2-ele ")
 MAGIC_BYTES = bytes([0x69, 0x32, 0x2d, 0x65, 0x6c, 0x65, 0x20])
 
@@ -63,13 +71,26 @@ class LRA1Tool:
         self.filename = filename
         # update または verify の場合はアップデート用アドレスを、initの場合は初期化用アドレスを設定
         self.flash_adrs = UPDATE_ADRS if mode in ('update', 'verify') else INIT_ADRS
-        self.file_buff = None  # ファイル内容（bytearray）
+        self.file_buff = None  # 転送データ（bytearray または bytes）
         self.file_size = 0     # ファイルサイズ
+        self.checksum = 0      # 転送データ全体のチェックサム（PCロード時に送信）
         self.mode_flag = None  # ファームウェア転送モードを格納
         if mode == 'update':
             self.mode_flag = BSL_CMD_RX_DATA_BLOCK
         elif mode == 'verify':
             self.mode_flag = BSL_CMD_RX_DATA_BLOCK_VERIFY
+        # データブロック送信コマンド（転送モードから一度だけ決定）
+        if self.mode_flag in (BSL_CMD_RX_DATA_BLOCK_VERIFY, BSL_CMD_RX_DATA_BLOCK_FAST):
+            self.block_cmd = self.mode_flag
+        else:
+            self.block_cmd = BSL_CMD_RX_DATA_BLOCK
+        # 転送ブロック用バッファ（ブロック毎に確保せず使い回す）
+        self._cmd_block = bytearray(256 + 16)
+        self._cmd_mv = memoryview(self._cmd_block)
+        # 送信フレーム用バッファ（ヘッダ3バイト + コマンド + CRC 2バイト）
+        self._frame = bytearray(256 + 16 + 5)
+        self._frame_mv = memoryview(self._frame)
+        self._last_percent = -1  # 最後に表示したプログレスバーの位置
 
     # --- シリアル通信・CRC計算・タイムアウト付き読み出し関連 ---
     @staticmethod
@@ -86,7 +107,7 @@ class LRA1Tool:
         ser.reset_input_buffer()
         ser.reset_output_buffer()
         ser.send_break(duration=0.001)  # 1ms ブレーク信号を送信
-        ser.write(b"\x03RESET\r\n")
+        ser.write(RESET_COMMAND)
         time.sleep(0.10)  # 100ms 待機
 
     @staticmethod
@@ -94,15 +115,23 @@ class LRA1Tool:
         """CRC-CCITT (0x1021) を初期値0xffffで計算"""
         return binascii.crc_hqx(data, 0xffff)
 
+    @staticmethod
+    def calc_checksum(data: bytes) -> int:
+        """全バイトの総和の下位16ビットを計算（sum() により C 実装で一括加算）"""
+        return sum(data) & 0xFFFF
+
+    @staticmethod
+    def set_timeout(ser: serial.Serial, timeout_sec: float):
+        """読み出しタイムアウトを設定（値が変わる場合のみポートを再設定する）"""
+        if ser.timeout != timeout_sec:
+            ser.timeout = timeout_sec
+
     @staticmethod
     def serial_getchar_to(ser: serial.Serial, timeout_sec: float) -> int:
         """指定したタイムアウト内でシリアルから1バイト読み出す"""
-        deadline = time.time() + timeout_sec
-        while time.time() < deadline:
-            if ser.in_waiting > 0:
-                return ser.read(1)[0]
-            time.sleep(0.001)
-        return -1
+        LRA1Tool.set_timeout(ser, timeout_sec)
+        c = ser.read(1)
+        return c[0] if c else -1
 
     @staticmethod
     def recv_response(ser: serial.Serial, expected_len: int) -> int:
@@ -110,12 +139,10 @@ class LRA1Tool:
         指定した長さのレスポンスを受信し、レスポンスコードを返す
           - エラーの場合は負の値を返す
         """
-        buff = bytearray()
-        for _ in range(expected_len):
-            c = LRA1Tool.serial_getchar_to(ser, RESP_TIMEOUT)
-            if c < 0:
-                return -2
-            buff.append(c)
+        LRA1Tool.set_timeout(ser, RESP_TIMEOUT)
+        buff = ser.read(expected_len)
+        if len(buff) < expected_len:
+            return -2
         # ヘッダーチェック
         if expected_len >= 2 and buff[1] != BSL_HEADER:
             return -3
@@ -124,46 +151,54 @@ class LRA1Tool:
             res |= buff[5]
         return res
 
-    @staticmethod
-    def send_command(ser: serial.Serial, cmd: bytes):
+    def build_command(self, cmd: bytes) -> int:
+        """
+        送信フレーム作成:
+          - ヘッダ、長さ、コマンド本体、CRC を送信フレームバッファに直接書き込む
+          - フレーム長を返す
+        """
+        length = len(cmd)
+        struct.pack_into('<BH', self._frame, 0, BSL_HEADER, length)
+        self._frame[3:3 + length] = cmd
+        struct.pack_into('<H', self._frame, 3 + length, self.calc_crc(cmd))
+        return length + 5
+
+    def write_frame(self, ser: serial.Serial, frame_len: int):
+        """作成済みの送信フレームを送信"""
+        ser.reset_input_buffer()
+        ser.write(self._frame_mv[:frame_len])
+
+    def send_command(self, ser: serial.Serial, cmd: bytes):
         """
         コマンド送信:
           - ヘッダ、長さ、コマンド本体、CRC を付加して送信
         """
-        ser.reset_input_buffer()
-        length = len(cmd)
-        data = bytearray([BSL_HEADER, length & 0xFF, (length >> 8) & 0xFF]) + cmd
-        crc = LRA1Tool.calc_crc(cmd)
-        data += bytearray([crc & 0xFF, (crc >> 8) & 0xFF])
-        ser.write(data)
+        self.write_frame(ser, self.build_command(cmd))
 
     # --- ファームウェア転送関連 ---
-    def send_rx_data_block(self, ser: serial.Serial, cmd: bytearray, adrs: int, num: int) -> int:
+    def build_rx_data_block(self, adrs: int, data: memoryview) -> int:
         """
-        データブロック送信:
-          - 転送モードに応じたコマンドをセットし、ブロック送信後にレスポンスを取得する
+        データブロックの送信フレーム作成:
+          - 転送モードに応じたコマンドとアドレス、データをセットしてフレームを作成する
+          - フレーム長を返す
         """
-        if self.mode_flag in (BSL_CMD_RX_DATA_BLOCK_VERIFY, BSL_CMD_RX_DATA_BLOCK_FAST):
-            cmd[0] = self.mode_flag
-        else:
-            cmd[0] = BSL_CMD_RX_DATA_BLOCK
-        # アドレス設定
-        cmd[1] = adrs & 0xFF
-        cmd[2] = (adrs >> 8) & 0xFF
-        cmd[3] = (adrs >> 16) & 0xFF
-        length = num + 4
-        self.send_command(ser, cmd[:length])
-        if self.mode_flag == BSL_CMD_RX_DATA_BLOCK_FAST:
-            return self.serial_getchar_to(ser, RESP_TIMEOUT)
-        return self.recv_response(ser, 8)
+        cmd = self._cmd_mv
+        # コマンドとアドレス（24ビット、リトルエンディアン）を設定
+        struct.pack_into('<BHB', cmd, 0, self.block_cmd, adrs & 0xFFFF, (adrs >> 16) & 0xFF)
+        length = len(data) + 4
+        cmd[4:length] = data
+        return self.build_command(cmd[:length])
 
-    @staticmethod
-    def update_progress(total: int, remain: int):
+    def update_progress(self, total: int, remain: int):
         """
         プログレスバーの表示更新:
           - 転送進捗を50文字幅のバーで表示
+          - バーの位置が変わらない場合は再描画しない
         """
         percent = int(((total - remain) * 50) / total)
+        if percent == self._last_percent:
+            return
+        self._last_percent = percent
         bar = '[' + '#' * percent + '-' * (50 - percent) + ']'
         sys.stdout.write('\r' + bar)
         sys.stdout.flush()
@@ -176,20 +211,22 @@ class LRA1Tool:
           - 失敗時は (None, エラーコード) を返す
         """
         try:
-            st = os.stat(self.filename)
+            size = os.path.getsize(self.filename)
         except Exception:
             return None, -1
 
-        if st.st_size < FILE_MIN_SIZE or st.st_size > FILE_MAX_SIZE:
+        if size < FILE_MIN_SIZE or size > FILE_MAX_SIZE:
             return None, -2
 
+        # 確保済みバッファへ直接読み込む（bytes を経由したコピーを避ける）
+        buff = bytearray(size)
         with open(self.filename, "rb") as fp:
-            buff = bytearray(fp.read())
+            size = fp.readinto(buff)
         # マジックバイトチェック（ファイルの特定オフセットから）
         offset = 0xb8
-        if buff[offset:offset+len(MAGIC_BYTES)] != MAGIC_BYTES:
+        if memoryview(buff)[offset:offset+len(MAGIC_BYTES)] != MAGIC_BYTES:
             return None, -2
-        return buff, len(buff)
+        return buff, size
 
     def loRa_update(self, ser: serial.Serial) -> int:
         """
@@ -197,16 +234,15 @@ class LRA1Tool:
           - DFUモード待ち、プログレスバー表示、各ブロック送信、最終コマンド送信を実施
           - エラーが発生した場合はそのエラーコードを返す
         """
-        checksum = 0
         adrs = self.flash_adrs
         ser.reset_input_buffer()
         wait_flag = False
         # DFUモード待ちループ
         while True:
-            ser.write(bytes([0xaa]))
-            if self.serial_getchar_to(ser, INIT_TIMEOUT) == 0x55:
-                ser.write(b"i2LoRa")
-                if self.serial_getchar_to(ser, INIT_TIMEOUT) == 0xaa:
+            ser.write(DFU_PROBE)
+            if self.serial_getchar_to(ser, INIT_TIMEOUT) == DFU_PROBE_ACK:
+                ser.write(DFU_KEY)
+                if self.serial_getchar_to(ser, INIT_TIMEOUT) == DFU_KEY_ACK:
                     break
             if not wait_flag:
                 print("Wait for DFU mode. Please reset LRA1.", end='', flush=True)
@@ -214,18 +250,23 @@ class LRA1Tool:
 
         total_size = self.file_size
         index = 0
+        mv = memoryview(self.file_buff)
+        waiting = False  # 応答待ちのブロックがあるかどうか
         # 256バイト単位で送信
-        while self.file_size > 0:
-            self.update_progress(total_size, self.file_size)
+        while True:
+            # 前のブロックの送信中（応答待ちの前）に次の転送ブロックを作成しておく
             num = 256 if self.file_size >= 256 else self.file_size
-            cmd_block = bytearray(256 + 16)
-            # 転送ブロック作成とチェックサム更新
-            for i in range(num):
-                cmd_block[i+4] = self.file_buff[index + i]
-                checksum = (checksum + self.file_buff[index + i]) & 0xFFFF
-            ret = self.send_rx_data_block(ser, cmd_block, adrs, num)
-            if ret != 0:
-                return ret
+            if num > 0:
+                frame_len = self.build_rx_data_block(adrs, mv[index:index + num])
+            if waiting:
+                ret = self.recv_response(ser, 8)
+                if ret != 0:
+                    return ret
+            if num == 0:
+                break
+            self.update_progress(total_size, self.file_size)
+            self.write_frame(ser, frame_len)
+            waiting = True
             adrs += num
             index += num
             self.file_size -= num
@@ -235,8 +276,8 @@ class LRA1Tool:
         final_cmd = bytearray(4)
         final_cmd[0] = BSL_CMD_LOAD_PC
         final_cmd[1] = 0x00
-        final_cmd[2] = checksum & 0xFF
-        final_cmd[3] = (checksum >> 8) & 0xFF
+        final_cmd[2] = self.checksum & 0xFF
+        final_cmd[3] = (self.checksum >> 8) & 0xFF
         self.send_command(ser, final_cmd)
         return self.recv_response(ser, 8)
 
@@ -250,7 +291,7 @@ class LRA1Tool:
         if self.mode == "init":
             # 初期化モード: 固定サイズのゼロバイト配列を使用
             self.file_size = INIT_SIZE
-            self.file_buff = bytearray([0] * self.file_size)
+            self.file_buff = bytes(self.file_size)
             print("Initializing")
         else:
             # update/verify モード: ファームウェアファイルの読み込み
@@ -263,12 +304,17 @@ class LRA1Tool:
                 sys.exit(self.file_size)
             msg = "Verifying" if self.mode_flag == BSL_CMD_RX_DATA_BLOCK_VERIFY else "Updating"
             print(msg)
+        # チェックサムは転送前にまとめて計算しておく
+        self.checksum = self.calc_checksum(self.file_buff)
         try:
             # シリアルポートのオープン（baud は指定があっても115200固定）
             ser = serial.Serial(self.port, 115200, timeout=0)
         except Exception:
             print(f"{self.port} device not open.")
             sys.exit(-1)
+        if sys.platform == 'win32' and hasattr(ser, 'set_buffer_size'):
+            # Windows では OS の受信/送信バッファを拡張（既定は4kB）
+            ser.set_buffer_size(rx_size=65536, tx_size=65536)
         ser.dtr = True  # 初期状態に設定
         if self.sw_reset:
             self.reset_cmd(ser)